@@ -26,8 +26,13 @@ fi
 # Copiar código fuente
 cp $LAMBDA_DIR/*.py $BUILD_DIR/
 
-# Instalar dependencias - CAMBIO AQUÍ
-python3 -m pip install -r $LAMBDA_DIR/requirements.txt -t $BUILD_DIR/
+# Instalar dependencias - wheels para el runtime de Lambda (python3.9, x86_64),
+# independientemente del sistema operativo y la versión de Python del equipo (orjson es binario)
+python3 -m pip install -r $LAMBDA_DIR/requirements.txt -t $BUILD_DIR/ \
+    --platform manylinux2014_x86_64 \
+    --python-version 3.9 \
+    --implementation cp \
+    --only-binary=:all:
 
 # Crear ZIP
 cd $BUILD_DIR
@@ -7,14 +7,15 @@ echo "Building Lambda package with Docker..."
 rm -rf terraform/lambda_packages
 mkdir -p terraform/lambda_packages
 
-# Usar imagen de Amazon Linux compatible con Lambda
+# Usar la imagen oficial del runtime de Lambda (python3.9, igual que terraform/lambda.tf)
+# para que las dependencias binarias (orjson) coincidan con el entorno de ejecución
 docker run --rm \
+  --entrypoint bash \
   -v $(pwd)/src/lambda:/var/task/src \
   -v $(pwd)/terraform/lambda_packages:/var/task/output \
-  amazonlinux:2 \
-  bash -c "
-    yum update -y && \
-    yum install -y python3 python3-pip zip && \
+  public.ecr.aws/lambda/python:3.9 \
+  -c "
+    yum install -y zip && \
     cd /var/task && \
     cp src/*.py . && \
     python3 -m pip install -r src/requirements.txt -t . && \
@@ -1,20 +1,70 @@
+import hashlib
 import json
 import boto3
+import orjson
 import requests
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 import os
+import random
+import time
 from decimal import Decimal
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 
 # Configurar logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Cliente DynamoDB
-dynamodb = boto3.resource('dynamodb')
 table_name = os.environ.get('DYNAMODB_TABLE_NAME', 'spacex-launches-dev')
-table = dynamodb.Table(table_name)
+
+# Keep-alive para reutilizar conexiones; el modo 'adaptive' reintenta
+# con backoff y limita la tasa ante throttling
+DYNAMODB_CONFIG = Config(
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+    max_pool_connections=50,
+    tcp_keepalive=True
+)
+
+# Tabla y cliente DynamoDB creados en la primera llamada y reutilizados en invocaciones "warm"
+_table = None
+_client = None
+
+# Item de control (no es un lanzamiento) donde se guarda el ETag de la API
+META_LAUNCH_ID = '__meta__'
+
+# Escritura en lotes: BatchWriteItem acepta como máximo 25 items por llamada
+BATCH_SIZE = 25
+BATCH_GET_SIZE = 100
+MAX_WORKERS = 16
+MAX_BATCH_RETRIES = 5
+
+# Sesión HTTP reutilizada en invocaciones "warm" (evita un handshake TLS por ejecución)
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+def get_table():
+    """
+    Devuelve la tabla DynamoDB, creando el recurso solo la primera vez
+    """
+    global _table
+    if _table is None:
+        _table = boto3.resource('dynamodb', config=DYNAMODB_CONFIG).Table(table_name)
+    return _table
+
+def get_client():
+    """
+    Devuelve el cliente DynamoDB de bajo nivel (sin la capa Resource), creado solo la primera vez
+    """
+    global _client
+    if _client is None:
+        _client = boto3.client('dynamodb', config=DYNAMODB_CONFIG)
+    return _client
 
 def lambda_handler(event, context):
     """
@@ -31,19 +81,28 @@ def lambda_handler(event, context):
             'body' in event  # API Gateway siempre incluye body
         )
         
-        logger.info(f"Tipo de invocación: {'manual' if is_manual_test else 'programada'}")
+        logger.info("Tipo de invocación: %s", 'manual' if is_manual_test else 'programada')
         
-        # Obtener datos de la API de SpaceX
-        spacex_data = fetch_spacex_launches()
+        # Obtener datos de la API de SpaceX (la invocación manual siempre descarga todo)
+        stored_etag = None if is_manual_test else get_stored_etag()
+        spacex_data, etag = fetch_spacex_launches(stored_etag)
         
-        if not spacex_data:
+        if spacex_data is None:
+            # 304 Not Modified: nada que procesar desde la última ejecución
+            logger.info("Datos de SpaceX sin cambios (ETag %s)", stored_etag)
+            result = {'processed': 0, 'written': 0, 'unchanged': 0, 'errors': 0}
+        elif not spacex_data:
             logger.error("No se pudieron obtener datos de la API de SpaceX")
             return create_response(500, "Error obteniendo datos de SpaceX")
+        else:
+            # Procesar y guardar datos
+            result = process_and_save_launches(spacex_data)
+            
+            # Solo se guarda el ETag si todo se escribió, para reintentar en la próxima ejecución
+            if etag and result['errors'] == 0:
+                save_etag(etag)
         
-        # Procesar y guardar datos
-        result = process_and_save_launches(spacex_data)
-        
-        logger.info(f"Procesamiento completado: {result}")
+        logger.info("Procesamiento completado: %s", result)
         
         # Respuesta detallada para invocación manual
         response_body = {
@@ -52,9 +111,10 @@ def lambda_handler(event, context):
             'timestamp': datetime.now(timezone.utc).isoformat(),
             'summary': {
                 'total_processed': result['processed'],
-                'new_records': result['created'],
-                'updated_records': result['updated'],
+                'written_records': result['written'],
+                'unchanged_records': result['unchanged'],
                 'errors': result['errors'],
+                'api_not_modified': spacex_data is None,
                 'api_endpoint': 'https://api.spacexdata.com/v3/launches',
                 'table_name': table_name
             }
@@ -70,130 +130,181 @@ def lambda_handler(event, context):
         return create_response(200, response_body)
         
     except Exception as e:
-        logger.error(f"Error en lambda_handler: {str(e)}")
+        logger.error("Error en lambda_handler: %s", e)
         return create_response(500, f"Error interno: {str(e)}")
 
-def fetch_spacex_launches() -> List[Dict[str, Any]]:
+def fetch_spacex_launches(etag: Optional[str] = None) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
     """
     Obtiene los datos de lanzamientos desde la API de SpaceX v3
+    Envía If-None-Match con el ETag previo; retorna (None, etag) si la API responde 304
+    Retorna (lanzamientos, ETag de la respuesta)
     """
     try:
         url = "https://api.spacexdata.com/v3/launches"
-        logger.info(f"Realizando petición a: {url}")
+        logger.info("Realizando petición a: %s", url)
+        
+        headers = {'If-None-Match': etag} if etag else {}
+        response = SESSION.get(url, timeout=30, headers=headers)
+        
+        if response.status_code == 304:
+            return None, etag
         
-        response = requests.get(url, timeout=30)
         response.raise_for_status()
         
-        launches = response.json()
-        logger.info(f"Obtenidos {len(launches)} lanzamientos de la API")
+        launches = orjson.loads(response.content)
+        logger.info("Obtenidos %d lanzamientos de la API", len(launches))
         
-        return launches
+        return launches, response.headers.get('ETag')
         
     except requests.RequestException as e:
-        logger.error(f"Error en petición HTTP: {str(e)}")
-        return []
-    except json.JSONDecodeError as e:
-        logger.error(f"Error decodificando JSON: {str(e)}")
-        return []
+        logger.error("Error en petición HTTP: %s", e)
+        return [], None
+    except orjson.JSONDecodeError as e:
+        logger.error("Error decodificando JSON: %s", e)
+        return [], None
+
+def get_stored_etag() -> Optional[str]:
+    """
+    Lee el ETag de la última descarga completa guardado en DynamoDB
+    """
+    try:
+        response = get_table().get_item(Key={'launch_id': META_LAUNCH_ID}, ProjectionExpression='etag')
+        return response.get('Item', {}).get('etag')
+        
+    except Exception as e:
+        logger.error("Error leyendo ETag: %s", e)
+        return None
+
+def save_etag(etag: str) -> None:
+    """
+    Guarda el ETag de la API en el item de control de DynamoDB
+    """
+    try:
+        get_table().put_item(Item={
+            'launch_id': META_LAUNCH_ID,
+            'etag': etag,
+            'last_updated': datetime.now(timezone.utc).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error("Error guardando ETag: %s", e)
 
 def process_and_save_launches(launches: List[Dict[str, Any]]) -> Dict[str, int]:
     """
-    Procesa y guarda los lanzamientos en DynamoDB usando upsert
+    Procesa los lanzamientos y los guarda en DynamoDB en lotes (BatchWriteItem)
     """
     stats = {
         'processed': 0,
-        'created': 0,
-        'updated': 0,
+        'written': 0,
+        'unchanged': 0,
         'errors': 0
     }
     
+    processed_launches = []
+    append = processed_launches.append
+    
+    # Un único timestamp para todos los lanzamientos de esta ejecución
+    now_iso = datetime.now(timezone.utc).isoformat()
+    
     for launch in launches:
         try:
             # Procesar datos del lanzamiento
-            processed_launch = process_launch_data(launch)
-            
-            # Guardar en DynamoDB con upsert
-            save_result = upsert_launch_to_dynamodb(processed_launch)
-            
+            append(process_launch_data(launch, now_iso))
             stats['processed'] += 1
-            if save_result == 'created':
-                stats['created'] += 1
-            elif save_result == 'updated':
-                stats['updated'] += 1
                 
         except Exception as e:
-            logger.error(f"Error procesando lanzamiento {launch.get('flight_number', 'unknown')}: {str(e)}")
+            logger.error("Error procesando lanzamiento %s: %s", launch.get('flight_number', 'unknown'), e)
             stats['errors'] += 1
     
+    # Solo se escriben los lanzamientos nuevos o con contenido distinto
+    changed_launches = filter_changed_launches(processed_launches)
+    stats['unchanged'] = len(processed_launches) - len(changed_launches)
+    
+    # Guardar en DynamoDB en lotes (put_item ya es un upsert)
+    stats['written'] = save_launches_batch(changed_launches)
+    # save_launches_batch descarta launch_id duplicados: no cuentan como errores de escritura
+    stats['errors'] += len({launch['launch_id'] for launch in changed_launches}) - stats['written']
+    
     return stats
 
-def process_launch_data(launch: Dict[str, Any]) -> Dict[str, Any]:
+def process_launch_data(launch: Dict[str, Any], now_iso: Optional[str] = None) -> Dict[str, Any]:
     """
     Procesa y limpia los datos de un lanzamiento individual
+    now_iso permite reutilizar el mismo timestamp para todo el lote
     """
+    if now_iso is None:
+        now_iso = datetime.now(timezone.utc).isoformat()
+    
+    get = launch.get
+    flight_number = get('flight_number')
+    upcoming = get('upcoming', False)
+    launch_success = get('launch_success')
+    
     # Determinar el ID único (usando flight_number como clave)
-    launch_id = str(launch.get('flight_number', ''))
+    # Sin flight_number no hay clave válida (ni sort key del índice LatestLaunchesIndex)
+    if flight_number is None:
+        raise ValueError("Lanzamiento sin flight_number")
+    launch_id = str(flight_number)
     
     # Determinar estado del lanzamiento
-    status = determine_launch_status(launch)
+    if upcoming:
+        status = 'upcoming'
+    elif launch_success is True:
+        status = 'success'
+    elif launch_success is False:
+        status = 'failed'
+    else:
+        status = 'unknown'
     
     # Procesar información del cohete
-    rocket_info = launch.get('rocket', {})
+    rocket_info = get('rocket', {})
     rocket_name = rocket_info.get('rocket_name', 'Unknown')
     
     # Procesar payloads
-    payloads = process_payloads(launch.get('payloads', []))
+    payloads = process_payloads(get('payloads', []))
     
     # Procesar launchpad
-    launchpad = launch.get('launch_site', {})
+    launchpad = get('launch_site', {})
     launchpad_name = launchpad.get('site_name_long', launchpad.get('site_name', 'Unknown'))
     
     # Crear el objeto con los datos procesados
     processed_data = {
         'launch_id': launch_id,
-        'flight_number': launch.get('flight_number'),
-        'mission_name': launch.get('mission_name', 'Unknown Mission'),
+        'flight_number': flight_number,
+        'mission_name': get('mission_name', 'Unknown Mission'),
         'rocket_name': rocket_name,
-        'launch_date': launch.get('launch_date_utc', ''),
-        'launch_date_local': launch.get('launch_date_local', ''),
+        'launch_date': get('launch_date_utc', ''),
+        'launch_date_local': get('launch_date_local', ''),
         'status': status,
-        'launch_success': launch.get('launch_success'),
-        'upcoming': launch.get('upcoming', False),
-        'details': launch.get('details', ''),
+        'launch_success': launch_success,
+        'upcoming': upcoming,
+        'details': get('details', ''),
         'rocket': {
             'rocket_id': rocket_info.get('rocket_id', ''),
             'rocket_name': rocket_info.get('rocket_name', ''),
             'rocket_type': rocket_info.get('rocket_type', '')
         },
         'payloads': payloads,
-        'last_updated': datetime.now(timezone.utc).isoformat(),
-        'api_version': 'v3'
+        'api_version': 'v3',
+        # Partición constante para el índice LatestLaunchesIndex (orden por flight_number)
+        'pk_all': 'ALL'
     }
     
+    # Hash del contenido (sin last_updated) para no reescribir lanzamientos sin cambios
+    processed_data['content_hash'] = hashlib.blake2b(
+        orjson.dumps(processed_data, option=orjson.OPT_SORT_KEYS, default=str)
+    ).hexdigest()
+    processed_data['last_updated'] = now_iso
+    
     # Convertir a formato compatible con DynamoDB (Decimal para números)
     return convert_to_dynamodb_format(processed_data)
 
-def determine_launch_status(launch: Dict[str, Any]) -> str:
-    """
-    Determina el estado del lanzamiento basado en los datos disponibles
-    """
-    if launch.get('upcoming', False):
-        return 'upcoming'
-    elif launch.get('launch_success') is True:
-        return 'success'
-    elif launch.get('launch_success') is False:
-        return 'failed'
-    else:
-        return 'unknown'
-
 def process_payloads(payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Procesa la información de los payloads
     """
-    processed_payloads = []
-    
-    for payload in payloads:
-        processed_payload = {
+    return [
+        {
             'payload_id': payload.get('payload_id', ''),
             'payload_type': payload.get('payload_type', ''),
             'payload_mass_kg': payload.get('payload_mass_kg'),
@@ -203,43 +314,153 @@ def process_payloads(payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             'manufacturer': payload.get('manufacturer', ''),
             'nationality': payload.get('nationality', '')
         }
-        processed_payloads.append(processed_payload)
-    
-    return processed_payloads
+        for payload in payloads
+    ]
 
 def convert_to_dynamodb_format(data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Convierte datos a formato compatible con DynamoDB (float -> Decimal)
+    Recorre la estructura una sola vez, sin pasar por JSON
     """
-    return json.loads(json.dumps(data, default=str), parse_float=Decimal)
+    if isinstance(data, dict):
+        return {key: convert_to_dynamodb_format(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [convert_to_dynamodb_format(value) for value in data]
+    if isinstance(data, float):
+        return Decimal(str(data))
+    return data
 
-def upsert_launch_to_dynamodb(launch_data: Dict[str, Any]) -> str:
+def filter_changed_launches(launches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Inserta o actualiza un lanzamiento en DynamoDB usando put_item
-    Retorna 'created' o 'updated'
+    Descarta los lanzamientos cuyo content_hash coincide con el guardado en DynamoDB
+    Lee solo launch_id y content_hash con BatchGetItem (máx. 100 claves por llamada)
     """
-    try:
-        launch_id = launch_data['launch_id']
+    client = get_table().meta.client
+    launch_ids = list(dict.fromkeys(launch['launch_id'] for launch in launches))
+    stored_hashes = {}
+    
+    for i in range(0, len(launch_ids), BATCH_GET_SIZE):
+        page_ids = launch_ids[i:i + BATCH_GET_SIZE]
+        request_items = {
+            table_name: {
+                'Keys': [{'launch_id': launch_id} for launch_id in page_ids],
+                'ProjectionExpression': 'launch_id, content_hash'
+            }
+        }
         
-        # Verificar si el item existe
         try:
-            response = table.get_item(Key={'launch_id': launch_id})
-            item_exists = 'Item' in response
-        except Exception as e:
-            logger.error(f"Error verificando existencia del item {launch_id}: {str(e)}")
-            item_exists = False
+            for attempt in range(MAX_BATCH_RETRIES):
+                response = client.batch_get_item(RequestItems=request_items)
+                
+                for item in response.get('Responses', {}).get(table_name, []):
+                    stored_hashes[item['launch_id']] = item.get('content_hash')
+                
+                request_items = response.get('UnprocessedKeys', {})
+                if not request_items:
+                    break
+                
+                # Sin espera tras el último intento
+                if attempt < MAX_BATCH_RETRIES - 1:
+                    backoff_sleep(attempt)
+                    
+        except ClientError as e:
+            # Solo las claves de esta página se consideran cambiadas
+            logger.error("Error leyendo content_hash de %d claves (%s..%s): %s", len(page_ids), page_ids[0], page_ids[-1], e)
+    
+    # Las claves que no se pudieron leer se escriben igualmente
+    return [launch for launch in launches if stored_hashes.get(launch['launch_id']) != launch['content_hash']]
+
+def save_launches_batch(launches: List[Dict[str, Any]]) -> int:
+    """
+    Guarda los lanzamientos en DynamoDB con BatchWriteItem
+    Divide en lotes de 25 y los envía en paralelo con un pool de hilos
+    Retorna el número de items escritos
+    """
+    # BatchWriteItem rechaza claves duplicadas dentro de la misma petición
+    unique_launches = list({launch['launch_id']: launch for launch in launches}.values())
+    
+    # Serializar una sola vez al formato de atributos de DynamoDB ({'S': ...}, {'N': ...})
+    serialize = TypeSerializer().serialize
+    items = [{key: serialize(value) for key, value in launch.items()} for launch in unique_launches]
+    chunks = [items[i:i + BATCH_SIZE] for i in range(0, len(items), BATCH_SIZE)]
+    
+    written = 0
+    
+    # Crear el cliente antes de lanzar los hilos (la creación no es thread-safe)
+    get_client()
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(write_batch, chunk) for chunk in chunks]
         
-        # Usar put_item para insertar/actualizar
-        table.put_item(Item=launch_data)
+        for future in as_completed(futures):
+            try:
+                written += future.result()
+            except Exception as e:
+                logger.error("Error guardando lote en DynamoDB: %s", e)
+    
+    logger.info("%d lanzamientos guardados en DynamoDB", written)
+    
+    return written
+
+def write_batch(items: List[Dict[str, Any]]) -> int:
+    """
+    Envía un lote (<= 25 items ya serializados) con batch_write_item
+    Reintenta los UnprocessedItems con backoff exponencial
+    Retorna el número de items escritos
+    """
+    # El cliente de boto3 es thread-safe (el recurso Table no lo es)
+    client = get_client()
+    request_items = {table_name: [{'PutRequest': {'Item': item}} for item in items]}
+    
+    for attempt in range(MAX_BATCH_RETRIES):
+        try:
+            response = client.batch_write_item(RequestItems=request_items)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ValidationException':
+                raise
+            
+            # Un item inválido rechaza todo el lote: se reintenta item por item
+            # para que solo cuente como error el item inválido
+            logger.error("Lote rechazado por validación, reintentando item por item: %s", e)
+            pending = [request['PutRequest']['Item'] for request in request_items[table_name]]
+            return len(items) - len(pending) + write_items_individually(pending)
         
-        result = 'updated' if item_exists else 'created'
-        logger.info(f"Launch {launch_id} {result} successfully")
+        request_items = response.get('UnprocessedItems', {})
         
-        return result
+        if not request_items:
+            return len(items)
         
-    except Exception as e:
-        logger.error(f"Error guardando en DynamoDB: {str(e)}")
-        raise
+        # Sin espera tras el último intento
+        if attempt < MAX_BATCH_RETRIES - 1:
+            backoff_sleep(attempt)
+    
+    unprocessed = len(request_items.get(table_name, []))
+    logger.error("%d items sin procesar tras %d intentos", unprocessed, MAX_BATCH_RETRIES)
+    
+    return len(items) - unprocessed
+
+def write_items_individually(items: List[Dict[str, Any]]) -> int:
+    """
+    Escribe items ya serializados uno por uno con put_item
+    Retorna el número de items escritos
+    """
+    client = get_client()
+    written = 0
+    
+    for item in items:
+        try:
+            client.put_item(TableName=table_name, Item=item)
+            written += 1
+        except ClientError as e:
+            logger.error("Error guardando lanzamiento %s: %s", item.get('launch_id'), e)
+    
+    return written
+
+def backoff_sleep(attempt: int) -> None:
+    """
+    Espera con backoff exponencial y jitter antes de reenviar UnprocessedItems/Keys
+    """
+    time.sleep(0.05 * 2 ** attempt + random.uniform(0, 0.05))
 
 def create_response(status_code: int, body: Any) -> Dict[str, Any]:
     """
@@ -251,22 +472,23 @@ def create_response(status_code: int, body: Any) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps(body, default=str)
+        'body': orjson.dumps(body, default=str).decode()
     }
 
 def get_latest_launches_summary():
     """Obtener resumen de los últimos lanzamientos procesados"""
     try:
-        response = table.scan(Limit=5)
+        # Query descendente sobre el índice por flight_number: devuelve los 5 últimos
+        response = get_table().query(
+            IndexName='LatestLaunchesIndex',
+            KeyConditionExpression=Key('pk_all').eq('ALL'),
+            ScanIndexForward=False,
+            Limit=5
+        )
         items = response.get('Items', [])
         
-        # Ordenar por flight_number descendente
-        sorted_items = sorted(items, 
-                            key=lambda x: int(x.get('flight_number', 0)) if x.get('flight_number') else 0, 
-                            reverse=True)
-        
         summary = []
-        for item in sorted_items[:5]:
+        for item in items:
             summary.append({
                 'flight_number': str(item.get('flight_number', '')),
                 'mission_name': item.get('mission_name', ''),
@@ -279,34 +501,50 @@ def get_latest_launches_summary():
         return summary
         
     except Exception as e:
-        logger.error(f"Error obteniendo resumen: {e}")
+        logger.error("Error obteniendo resumen: %s", e)
         return []
 
 def get_table_stats():
     """Obtener estadísticas de la tabla DynamoDB"""
     try:
-        response = table.scan()
-        items = response.get('Items', [])
+        # Solo se leen los atributos necesarios y se recorren todas las páginas
+        scan_kwargs = {
+            'ProjectionExpression': '#s, rocket_name',
+            'FilterExpression': 'launch_id <> :meta',
+            'ExpressionAttributeNames': {'#s': 'status'},
+            'ExpressionAttributeValues': {':meta': META_LAUNCH_ID}
+        }
         
         stats = {
-            'total_records': len(items),
+            'total_records': 0,
             'by_status': {},
             'by_rocket': {}
         }
         
-        for item in items:
-            # Stats por status
-            status = item.get('status', 'unknown')
-            stats['by_status'][status] = stats['by_status'].get(status, 0) + 1
+        table = get_table()
+        
+        while True:
+            response = table.scan(**scan_kwargs)
+            
+            for item in response.get('Items', []):
+                stats['total_records'] += 1
+                
+                # Stats por status
+                status = item.get('status', 'unknown')
+                stats['by_status'][status] = stats['by_status'].get(status, 0) + 1
+                
+                # Stats por cohete
+                rocket = item.get('rocket_name', 'Unknown')
+                stats['by_rocket'][rocket] = stats['by_rocket'].get(rocket, 0) + 1
             
-            # Stats por cohete
-            rocket = item.get('rocket_name', 'Unknown')
-            stats['by_rocket'][rocket] = stats['by_rocket'].get(rocket, 0) + 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
         
         return stats
         
     except Exception as e:
-        logger.error(f"Error obteniendo stats: {e}")
+        logger.error("Error obteniendo stats: %s", e)
         return {}
 
 if __name__ == "__main__":
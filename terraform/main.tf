@@ -45,6 +45,16 @@ resource "aws_dynamodb_table" "spacex_launches" {
     name = "status"
     type = "S"
   }
+  
+  attribute {
+    name = "pk_all"
+    type = "S"
+  }
+  
+  attribute {
+    name = "flight_number"
+    type = "N"
+  }
 
   # Índices secundarios globales
   global_secondary_index {
@@ -70,6 +80,14 @@ resource "aws_dynamodb_table" "spacex_launches" {
     hash_key           = "status"
     projection_type    = "ALL"
   }
+  
+  # Últimos lanzamientos: partición constante + orden por flight_number
+  global_secondary_index {
+    name               = "LatestLaunchesIndex"
+    hash_key           = "pk_all"
+    range_key          = "flight_number"
+    projection_type    = "ALL"
+  }
 
   # Configuración adicional
   point_in_time_recovery {
@@ -1,22 +1,37 @@
+import subprocess
 import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+from decimal import Decimal
+from botocore.exceptions import ClientError
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/lambda')))
+import lambda_function
 from lambda_function import (
     lambda_handler,
     process_launch_data,
-    determine_launch_status,
-    upsert_launch_to_dynamodb,
+    process_and_save_launches,
+    save_launches_batch,
+    filter_changed_launches,
+    write_batch,
+    get_table,
+    get_client,
+    table_name,
+    fetch_spacex_launches,
+    get_table_stats,
+    get_latest_launches_summary,
+    convert_to_dynamodb_format,
 )
 
 class TestLambdaFunction(unittest.TestCase):
+    @patch("lambda_function.save_etag")
+    @patch("lambda_function.get_stored_etag", return_value=None)
     @patch("lambda_function.fetch_spacex_launches")
     @patch("lambda_function.process_and_save_launches")
-    def test_lambda_handler_success(self, mock_process_and_save, mock_fetch_launches):
+    def test_lambda_handler_success(self, mock_process_and_save, mock_fetch_launches, mock_get_etag, mock_save_etag):
         # Simula datos de la API y resultado del procesamiento
-        mock_fetch_launches.return_value = [{"flight_number": 1}]
-        mock_process_and_save.return_value = {"processed": 1, "created": 1, "updated": 0, "errors": 0}
+        mock_fetch_launches.return_value = ([{"flight_number": 1}], '"abc"')
+        mock_process_and_save.return_value = {"processed": 1, "written": 1, "unchanged": 0, "errors": 0}
 
         event = {}
         context = None
@@ -24,11 +39,28 @@ class TestLambdaFunction(unittest.TestCase):
 
         self.assertEqual(response["statusCode"], 200)
         self.assertIn("Procesamiento exitoso", response["body"])
+        mock_save_etag.assert_called_once_with('"abc"')
 
+    @patch("lambda_function.save_etag")
+    @patch("lambda_function.get_stored_etag", return_value='"abc"')
     @patch("lambda_function.fetch_spacex_launches")
-    def test_lambda_handler_api_error(self, mock_fetch_launches):
+    @patch("lambda_function.process_and_save_launches")
+    def test_lambda_handler_not_modified(self, mock_process_and_save, mock_fetch_launches, mock_get_etag, mock_save_etag):
+        # Simula respuesta 304 de la API
+        mock_fetch_launches.return_value = (None, '"abc"')
+
+        response = lambda_handler({}, None)
+
+        self.assertEqual(response["statusCode"], 200)
+        mock_fetch_launches.assert_called_once_with('"abc"')
+        mock_process_and_save.assert_not_called()
+        mock_save_etag.assert_not_called()
+
+    @patch("lambda_function.get_stored_etag", return_value=None)
+    @patch("lambda_function.fetch_spacex_launches")
+    def test_lambda_handler_api_error(self, mock_fetch_launches, mock_get_etag):
         # Simula error al obtener datos de la API
-        mock_fetch_launches.return_value = []
+        mock_fetch_launches.return_value = ([], None)
 
         event = {}
         context = None
@@ -53,38 +85,284 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(result["mission_name"], "Test Mission")
         self.assertEqual(result["rocket_name"], "Falcon 9")
         self.assertEqual(result["status"], "success")
+        self.assertEqual(result["pk_all"], "ALL")
+
+    def test_process_launch_data_payloads(self):
+        launch = {"flight_number": 1, "payloads": [{"payload_id": "Sat-1", "payload_mass_kg": 12.5, "orbit": "LEO"}]}
+        payloads = process_launch_data(launch)["payloads"]
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(payloads[0]["payload_id"], "Sat-1")
+        self.assertEqual(payloads[0]["payload_mass_kg"], Decimal("12.5"))
+        self.assertEqual(payloads[0]["customers"], [])
+
+    def test_process_launch_data_status(self):
+        self.assertEqual(process_launch_data({"flight_number": 1, "upcoming": True})["status"], "upcoming")
+        self.assertEqual(process_launch_data({"flight_number": 1, "launch_success": True})["status"], "success")
+        self.assertEqual(process_launch_data({"flight_number": 1, "launch_success": False})["status"], "failed")
+        self.assertEqual(process_launch_data({"flight_number": 1})["status"], "unknown")
+
+    def test_process_launch_data_missing_flight_number(self):
+        with self.assertRaises(ValueError):
+            process_launch_data({})
+        with self.assertRaises(ValueError):
+            process_launch_data({"flight_number": None})
+
+    @patch("lambda_function.filter_changed_launches", side_effect=lambda items: items)
+    @patch("lambda_function.save_launches_batch")
+    def test_process_and_save_launches_skips_missing_flight_number(self, mock_save, mock_filter):
+        mock_save.side_effect = lambda items: len(items)
+        result = process_and_save_launches([{"flight_number": None}, {"flight_number": 2}])
+        items = mock_save.call_args.args[0]
+        self.assertEqual([item["launch_id"] for item in items], ["2"])
+        self.assertEqual(result, {"processed": 1, "written": 1, "unchanged": 0, "errors": 1})
+
+    @patch("lambda_function.get_client")
+    def test_save_launches_batch_chunks_of_25(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        items = [{"launch_id": str(i)} for i in range(60)]
+        result = save_launches_batch(items)
+        self.assertEqual(result, 60)
+        self.assertEqual(client.batch_write_item.call_count, 3)
+        sizes = sorted(len(c.kwargs["RequestItems"][table_name]) for c in client.batch_write_item.call_args_list)
+        self.assertEqual(sizes, [10, 25, 25])
+
+    @patch("lambda_function.get_client")
+    def test_save_launches_batch_serializes_items(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        save_launches_batch([{"launch_id": "1", "flight_number": Decimal("1"), "upcoming": False, "details": None}])
+        request = client.batch_write_item.call_args.kwargs["RequestItems"][table_name][0]
+        self.assertEqual(request["PutRequest"]["Item"], {
+            "launch_id": {"S": "1"},
+            "flight_number": {"N": "1"},
+            "upcoming": {"BOOL": False},
+            "details": {"NULL": True},
+        })
+
+    @patch("lambda_function.time.sleep")
+    @patch("lambda_function.get_client")
+    def test_write_batch_retries_unprocessed_items(self, mock_get_client, mock_sleep):
+        client = mock_get_client.return_value
+        pending = [{"PutRequest": {"Item": {"launch_id": {"S": "2"}}}}]
+        client.batch_write_item.side_effect = [
+            {"UnprocessedItems": {table_name: pending}},
+            {"UnprocessedItems": {}},
+        ]
+        result = write_batch([{"launch_id": {"S": "1"}}, {"launch_id": {"S": "2"}}])
+        self.assertEqual(result, 2)
+        self.assertEqual(client.batch_write_item.call_args_list[1].kwargs["RequestItems"], {table_name: pending})
+        mock_sleep.assert_called_once()
+
+    @patch("lambda_function.get_client")
+    def test_write_batch_isolates_invalid_items(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.batch_write_item.side_effect = ClientError(
+            {"Error": {"Code": "ValidationException", "Message": "empty key"}}, "BatchWriteItem"
+        )
+
+        def put_item(TableName, Item):
+            if Item["launch_id"] == {"S": ""}:
+                raise ClientError({"Error": {"Code": "ValidationException", "Message": "empty key"}}, "PutItem")
+
+        client.put_item.side_effect = put_item
+        result = write_batch([{"launch_id": {"S": "1"}}, {"launch_id": {"S": ""}}, {"launch_id": {"S": "3"}}])
+        self.assertEqual(result, 2)
+        self.assertEqual(client.put_item.call_count, 3)
+
+    @patch("lambda_function.get_client")
+    def test_write_batch_raises_other_client_errors(self, mock_get_client):
+        mock_get_client.return_value.batch_write_item.side_effect = ClientError(
+            {"Error": {"Code": "AccessDeniedException", "Message": "denied"}}, "BatchWriteItem"
+        )
+        with self.assertRaises(ClientError):
+            write_batch([{"launch_id": {"S": "1"}}])
+
+    @patch("lambda_function.time.sleep")
+    @patch("lambda_function.get_client")
+    def test_write_batch_gives_up_after_max_retries(self, mock_get_client, mock_sleep):
+        client = mock_get_client.return_value
+        pending = [{"PutRequest": {"Item": {"launch_id": {"S": "2"}}}}]
+        client.batch_write_item.return_value = {"UnprocessedItems": {table_name: pending}}
+        result = write_batch([{"launch_id": {"S": "1"}}, {"launch_id": {"S": "2"}}])
+        self.assertEqual(result, 1)
+        self.assertEqual(client.batch_write_item.call_count, lambda_function.MAX_BATCH_RETRIES)
+        self.assertEqual(mock_sleep.call_count, lambda_function.MAX_BATCH_RETRIES - 1)
+
+    @patch("lambda_function.filter_changed_launches", side_effect=lambda items: items)
+    @patch("lambda_function.save_launches_batch")
+    def test_process_and_save_launches_shares_timestamp(self, mock_save, mock_filter):
+        mock_save.side_effect = lambda items: len(items)
+        process_and_save_launches([{"flight_number": 1}, {"flight_number": 2}])
+        items = mock_save.call_args.args[0]
+        self.assertEqual(items[0]["last_updated"], items[1]["last_updated"])
+
+    @patch("lambda_function.filter_changed_launches", side_effect=lambda items: items)
+    @patch("lambda_function.save_launches_batch")
+    def test_process_and_save_launches_counts_errors(self, mock_save, mock_filter):
+        mock_save.side_effect = lambda items: len(items)
+        launches = [{"flight_number": 1}, {"flight_number": 2, "rocket": None}]
+        result = process_and_save_launches(launches)
+        self.assertEqual(result, {"processed": 1, "written": 1, "unchanged": 0, "errors": 1})
+
+    @patch("lambda_function.filter_changed_launches", side_effect=lambda items: items)
+    @patch("lambda_function.get_client")
+    def test_process_and_save_launches_duplicates_are_not_errors(self, mock_get_client, mock_filter):
+        mock_get_client.return_value.batch_write_item.return_value = {"UnprocessedItems": {}}
+        result = process_and_save_launches([{"flight_number": 1}, {"flight_number": 1}, {"flight_number": 2}])
+        self.assertEqual(result, {"processed": 3, "written": 2, "unchanged": 0, "errors": 0})
+
+    def test_content_hash_ignores_last_updated(self):
+        launch = {"flight_number": 7, "mission_name": "Same"}
+        first = process_launch_data(launch, "2024-01-01T00:00:00+00:00")
+        second = process_launch_data(launch, "2024-06-01T00:00:00+00:00")
+        self.assertEqual(first["content_hash"], second["content_hash"])
+        changed = process_launch_data({"flight_number": 7, "mission_name": "Other"})
+        self.assertNotEqual(first["content_hash"], changed["content_hash"])
+
+    @patch("lambda_function.get_table")
+    def test_filter_changed_launches_skips_unchanged(self, mock_get_table):
+        mock_table = mock_get_table.return_value
+        mock_table.meta.client.batch_get_item.return_value = {
+            "Responses": {table_name: [
+                {"launch_id": "1", "content_hash": "same"},
+                {"launch_id": "2", "content_hash": "old"},
+            ]},
+            "UnprocessedKeys": {},
+        }
+        launches = [
+            {"launch_id": "1", "content_hash": "same"},
+            {"launch_id": "2", "content_hash": "new"},
+            {"launch_id": "3", "content_hash": "new"},
+        ]
+        result = filter_changed_launches(launches)
+        self.assertEqual([launch["launch_id"] for launch in result], ["2", "3"])
+
+    @patch("lambda_function.SESSION")
+    def test_fetch_spacex_launches_uses_session(self, mock_session):
+        mock_session.get.return_value.status_code = 200
+        mock_session.get.return_value.content = b'[{"flight_number": 1}]'
+        mock_session.get.return_value.headers = {"ETag": '"abc"'}
+        result = fetch_spacex_launches()
+        self.assertEqual(result, ([{"flight_number": 1}], '"abc"'))
+        mock_session.get.assert_called_once_with("https://api.spacexdata.com/v3/launches", timeout=30, headers={})
+
+    @patch("lambda_function.SESSION")
+    def test_fetch_spacex_launches_not_modified(self, mock_session):
+        mock_session.get.return_value.status_code = 304
+        result = fetch_spacex_launches('"abc"')
+        self.assertEqual(result, (None, '"abc"'))
+        self.assertEqual(mock_session.get.call_args.kwargs["headers"], {"If-None-Match": '"abc"'})
+
+    @patch("lambda_function.BATCH_GET_SIZE", 1)
+    @patch("lambda_function.get_table")
+    def test_filter_changed_launches_read_error_only_affects_page(self, mock_get_table):
+        mock_table = mock_get_table.return_value
+        mock_table.meta.client.batch_get_item.side_effect = [
+            ClientError({"Error": {"Code": "ValidationException", "Message": "bad key"}}, "BatchGetItem"),
+            {"Responses": {table_name: [{"launch_id": "2", "content_hash": "b"}]}, "UnprocessedKeys": {}},
+        ]
+        launches = [{"launch_id": "1", "content_hash": "a"}, {"launch_id": "2", "content_hash": "b"}]
+        self.assertEqual(filter_changed_launches(launches), [launches[0]])
+
+    @patch("lambda_function.get_table")
+    def test_filter_changed_launches_propagates_unexpected_errors(self, mock_get_table):
+        mock_get_table.return_value.meta.client.batch_get_item.side_effect = KeyError("boom")
+        with self.assertRaises(KeyError):
+            filter_changed_launches([{"launch_id": "1", "content_hash": "a"}])
+
+    @patch("lambda_function.time.sleep")
+    @patch("lambda_function.get_table")
+    def test_filter_changed_launches_retries_unprocessed_keys(self, mock_get_table, mock_sleep):
+        mock_table = mock_get_table.return_value
+        pending = {table_name: {"Keys": [{"launch_id": "2"}], "ProjectionExpression": "launch_id, content_hash"}}
+        mock_table.meta.client.batch_get_item.side_effect = [
+            {"Responses": {table_name: [{"launch_id": "1", "content_hash": "same"}]}, "UnprocessedKeys": pending},
+            {"Responses": {table_name: [{"launch_id": "2", "content_hash": "same"}]}, "UnprocessedKeys": {}},
+        ]
+        launches = [{"launch_id": "1", "content_hash": "same"}, {"launch_id": "2", "content_hash": "same"}]
+        self.assertEqual(filter_changed_launches(launches), [])
+        calls = mock_table.meta.client.batch_get_item.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1].kwargs["RequestItems"], pending)
+        mock_sleep.assert_called_once()
+
+    @patch("lambda_function.get_table")
+    def test_get_table_stats_paginates(self, mock_get_table):
+        mock_table = mock_get_table.return_value
+        mock_table.scan.side_effect = [
+            {"Items": [{"status": "success", "rocket_name": "Falcon 9"}], "LastEvaluatedKey": {"launch_id": "1"}},
+            {"Items": [{"status": "failed", "rocket_name": "Falcon 1"}]},
+        ]
+        stats = get_table_stats()
+        self.assertEqual(stats["total_records"], 2)
+        self.assertEqual(stats["by_status"], {"success": 1, "failed": 1})
+        self.assertEqual(stats["by_rocket"], {"Falcon 9": 1, "Falcon 1": 1})
+        self.assertEqual(mock_table.scan.call_args_list[1].kwargs["ExclusiveStartKey"], {"launch_id": "1"})
+
+    @patch("lambda_function.get_table")
+    def test_get_latest_launches_summary_queries_index(self, mock_get_table):
+        mock_table = mock_get_table.return_value
+        mock_table.query.return_value = {"Items": [{"flight_number": 110, "mission_name": "Latest"}]}
+        summary = get_latest_launches_summary()
+        self.assertEqual(summary[0]["flight_number"], "110")
+        kwargs = mock_table.query.call_args.kwargs
+        self.assertEqual(kwargs["IndexName"], "LatestLaunchesIndex")
+        self.assertFalse(kwargs["ScanIndexForward"])
+        self.assertEqual(kwargs["Limit"], 5)
+        mock_table.scan.assert_not_called()
+
+    def test_convert_to_dynamodb_format_floats_to_decimal(self):
+        data = {"mass": 1.5, "payloads": [{"mass": 2.25, "orbit": "LEO"}], "flight": 3, "success": None}
+        result = convert_to_dynamodb_format(data)
+        self.assertEqual(result["mass"], Decimal("1.5"))
+        self.assertEqual(result["payloads"][0]["mass"], Decimal("2.25"))
+        self.assertEqual(result["payloads"][0]["orbit"], "LEO")
+        self.assertEqual(result["flight"], 3)
+        self.assertIsNone(result["success"])
+
+    def test_import_creates_no_dynamodb_resource(self):
+        # Se importa en un proceso aparte para no reconstruir el módulo compartido por los tests
+        script = (
+            "from unittest.mock import patch\n"
+            "with patch('boto3.resource') as resource, patch('boto3.client') as client:\n"
+            "    import lambda_function\n"
+            "assert not resource.called and not client.called\n"
+            "assert lambda_function._table is None and lambda_function._client is None\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(lambda_function.__file__),
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    @patch("lambda_function._table", None)
+    @patch("lambda_function.boto3")
+    def test_get_table_is_lazy_and_uses_adaptive_retries(self, mock_boto3):
+        mock_boto3.resource.assert_not_called()
+        table = get_table()
+        self.assertIs(get_table(), table)
+        mock_boto3.resource.assert_called_once_with("dynamodb", config=lambda_function.DYNAMODB_CONFIG)
+        mock_boto3.resource.return_value.Table.assert_called_once_with(table_name)
+        self.assertEqual(lambda_function.DYNAMODB_CONFIG.retries["mode"], "adaptive")
+
+    @patch("lambda_function._client", None)
+    @patch("lambda_function.boto3")
+    def test_get_client_is_lazy_and_uses_adaptive_retries(self, mock_boto3):
+        mock_boto3.client.assert_not_called()
+        client = get_client()
+        self.assertIs(get_client(), client)
+        mock_boto3.client.assert_called_once_with("dynamodb", config=lambda_function.DYNAMODB_CONFIG)
+        mock_boto3.resource.assert_not_called()
+        self.assertEqual(lambda_function.DYNAMODB_CONFIG.retries["mode"], "adaptive")
 
-    def test_determine_launch_status(self):
-        self.assertEqual(determine_launch_status({"upcoming": True}), "upcoming")
-        self.assertEqual(determine_launch_status({"launch_success": True}), "success")
-        self.assertEqual(determine_launch_status({"launch_success": False}), "failed")
-        self.assertEqual(determine_launch_status({}), "unknown")
-
-    @patch("lambda_function.table")
-    def test_upsert_launch_to_dynamodb_created(self, mock_table):
-        # Simula que el item no existe
-        mock_table.get_item.return_value = {}
-        mock_table.put_item.return_value = {}
-        launch_data = {"launch_id": "99"}
-        result = upsert_launch_to_dynamodb(launch_data)
-        self.assertEqual(result, "created")
-
-    @patch("lambda_function.table")
-    def test_upsert_launch_to_dynamodb_updated(self, mock_table):
-        # Simula que el item sí existe
-        mock_table.get_item.return_value = {"Item": {"launch_id": "99"}}
-        mock_table.put_item.return_value = {}
-        launch_data = {"launch_id": "99"}
-        result = upsert_launch_to_dynamodb(launch_data)
-        self.assertEqual(result, "updated")
-
-    @patch("lambda_function.table")
-    def test_upsert_launch_to_dynamodb_error(self, mock_table):
-        # Simula error en put_item
-        mock_table.get_item.return_value = {}
-        mock_table.put_item.side_effect = Exception("Dynamo error")
-        with self.assertRaises(Exception):
-            upsert_launch_to_dynamodb({"launch_id": "error"})
+    @patch("lambda_function.SESSION")
+    def test_fetch_spacex_launches_invalid_json(self, mock_session):
+        mock_session.get.return_value.status_code = 200
+        mock_session.get.return_value.content = b"<html>"
+        self.assertEqual(fetch_spacex_launches(), ([], None))
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file